@@ -0,0 +1,82 @@
+"""Compare allocations of the dict based and lazy host serialization.
+
+"tree" is what the export tree holds before dumping: NoOmitDict copies of
+every host against NoOmitItems views. "peak" is the peak while dumping,
+which is dominated by the node graph ruamel builds for the whole document
+before it emits anything, so it barely differs between the two.
+
+Run with ``python -m benchmarks.omit_allocations [hosts]``.
+"""
+import dataclasses
+import ipaddress
+import sys
+import tracemalloc
+import typing
+
+from ruamel import yaml
+
+from inventory_started.inventory import InventoryDumper
+from inventory_started.omit import OMIT, NoOmitDict, NoOmitItems
+
+
+@dataclasses.dataclass
+class Host:
+    name: str
+    ansible_host: ipaddress.IPv4Address
+    bmc_address: str
+    bmc_user: str
+    bmc_password: str
+    mac: str
+    vendor: str = "Dell"
+    role: str = "worker"
+    vm_host: typing.Any = OMIT
+    vm_spec: typing.Any = OMIT
+    installation_disk_path: typing.Any = OMIT
+    network_config: typing.Any = OMIT
+
+
+def make_hosts(count):
+    return [
+        Host(
+            name=f"node{i}",
+            ansible_host=ipaddress.IPv4Address(0x0A000000 + i),
+            bmc_address=f"bmc{i}.example.com",
+            bmc_user="root",
+            bmc_password="calvin",
+            mac=f"52:54:00:{i >> 16 & 0xFF:02x}:{i >> 8 & 0xFF:02x}:{i & 0xFF:02x}",
+        )
+        for i in range(count)
+    ]
+
+
+def dict_tree(hosts):
+    return {"hosts": {h.name: NoOmitDict(dataclasses.asdict(h)) for h in hosts}}
+
+
+def lazy_tree(hosts):
+    return {"hosts": {h.name: NoOmitItems(h) for h in hosts}}
+
+
+def measure(build, hosts):
+    tracemalloc.start()
+    tree = build(hosts)
+    tree_blocks = sum(
+        s.count for s in tracemalloc.take_snapshot().statistics("filename")
+    )
+    tree_size, _ = tracemalloc.get_traced_memory()
+    yaml.dump(tree, Dumper=InventoryDumper)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tree_blocks, tree_size, peak
+
+
+def main(count=10_000):
+    hosts = make_hosts(count)
+    print(f"{'path':<10} {'tree blocks':>12} {'tree bytes':>12} {'peak bytes':>12}")
+    for name, build in (("dict", dict_tree), ("lazy", lazy_tree)):
+        blocks, size, peak = measure(build, hosts)
+        print(f"{name:<10} {blocks:>12} {size:>12} {peak:>12}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,462 @@
+"""Randomised stress harness for the questionaire and the exporter.
+
+Three stages, all seeded so a failure can be replayed with ``--seed``:
+
+* ``fuzz-types`` feeds random valid and invalid answers through
+  ``Questionaire._matches_type`` for scalar, Union and ``ListQuestion`` types.
+* ``headless`` runs ``Questionaire.run`` with random answer sets, invalid
+  answers first for a share of the typed questions, then checks the
+  resulting inventory survives export -> load.
+* ``shapes`` round trips inventories of random shape, host classes and
+  omitted fields, then records validation and export throughput and peak
+  memory for random inventories of increasing size.
+
+Run with ``python -m benchmarks.stress [--seed N] [--runs N] [stage ...]``.
+"""
+import argparse
+import dataclasses
+import enum
+import ipaddress
+import random
+import re
+import time
+import tracemalloc
+import types
+import typing
+
+from ruamel import yaml
+
+from inventory_started import parts
+from inventory_started.inventory import Inventory, InventoryExporter
+from inventory_started.main import ListQuestion, Question, Questionaire
+from inventory_started.omit import OMIT, NoOmitItems
+
+
+class AnswersExhausted(Exception):
+    pass
+
+
+class ScriptedQuestionaire(Questionaire):
+    """Questionaire whose answers come from a callable instead of stdin."""
+
+    def __init__(self, responder, max_answers=500):
+        super().__init__()
+        self.responder = responder
+        self.max_answers = max_answers
+        self.prompts = []
+        self.outputs = []
+
+    def _input(self, text):
+        if len(self.prompts) >= self.max_answers:
+            raise AnswersExhausted(f"No answer after {len(self.prompts)} prompts")
+        self.prompts.append(text)
+        return self.responder(text)
+
+    def _output(self, text, end="\n"):
+        self.outputs.append(text)
+
+
+def _ip(rng):
+    return str(ipaddress.IPv4Address(0x0A000000 + rng.randrange(1, 1 << 16)))
+
+
+def _mac(rng):
+    if rng.random() < 0.5:
+        # Only decimal digits, which YAML 1.1 reads as a sexagesimal int
+        return ":".join(
+            ["52", "54", "00", *(f"{rng.randrange(60):02d}" for _ in "abc")]
+        )
+    return ":".join(f"{b:02x}" for b in [0x52, 0x54, 0x00, *rng.randbytes(3)])
+
+
+# Some of these are booleans, null or numbers to YAML 1.1 unless quoted
+_WORDS = ["alpha", "bravo", "charlie", "yes", "off", "null", "12:30", "0x1f"]
+
+
+def _word(rng):
+    return rng.choice(_WORDS)
+
+
+_INVALID = ["", "not-a-value", "999.999.1.1", "1,,2", "::::", "\t"]
+
+
+class RandomAnswers:
+    """Map prompts onto random, mostly valid answers.
+
+    Typed answers are preceded by an invalid one ``invalid_rate`` of the time
+    so the re-ask loops are exercised.
+    """
+
+    _typed = [
+        (re.compile(r"CIDR|network are NTP"), lambda rng: "10.0.0.0/16"),
+        (re.compile(r"host prefix"), lambda rng: str(rng.choice([23, 24]))),
+        (re.compile(r"prefix length"), lambda rng: "24"),
+        (re.compile(r"vlan tag"), lambda rng: str(rng.randrange(1, 4095))),
+        (re.compile(r"Mac address"), _mac),
+        (re.compile(r"DNS servers"), lambda rng: f"{_ip(rng)},{_ip(rng)}"),
+        (
+            re.compile(
+                r"VIP|ip address|IP address|IP in DHCP|gatewaty|NTP Server"
+                r"|BMC Address|Upstream dns|dns server|Base address"
+            ),
+            _ip,
+        ),
+    ]
+    _free = [
+        (re.compile(r"crucible dir"), lambda rng: "/opt/crucible"),
+        (re.compile(r"domain"), lambda rng: "example.com"),
+        (re.compile(r"interface"), lambda rng: "eno1"),
+        (re.compile(r"name|VM Host|BMC|Cert\."), _word),
+    ]
+
+    def __init__(self, rng, invalid_rate=0.2, max_extra=3):
+        self.rng = rng
+        self.invalid_rate = invalid_rate
+        self.max_extra = max_extra
+        self._pending_valid = None
+        self._extra = 0
+
+    def __call__(self, text):
+        rng = self.rng
+        if self._pending_valid is not None:
+            answer, self._pending_valid = self._pending_valid, None
+            return answer
+
+        if choices := re.search(r"\[([^\]]*,[^\]]*)\]", text):
+            return rng.choice(choices.group(1).split(","))
+        if "another" in text:
+            self._extra += 1
+            return "y" if self._extra <= self.max_extra and rng.random() < 0.5 else "n"
+        if "discover" in text or "nmstate" in text:
+            return "n"
+        if re.search(r"\[[yY]/[nN]\]|^(Do|Is|Can|Does|Would)\b", text):
+            return rng.choice(["y", "n", "yes", "no", "", "maybe"])
+
+        for pattern, make in self._typed:
+            if pattern.search(text):
+                if rng.random() < self.invalid_rate:
+                    self._pending_valid = make(rng)
+                    return rng.choice(_INVALID)
+                return make(rng)
+        for pattern, make in self._free:
+            if pattern.search(text):
+                return make(rng)
+        return _word(rng)
+
+
+def fuzz_types(rng, runs):
+    """Check _matches_type returns the first valid answer for random inputs."""
+    cases = [
+        (int, lambda: str(rng.randrange(-1000, 1000)), Question),
+        (ipaddress.IPv4Address, lambda: _ip(rng), Question),
+        (ipaddress.IPv4Network, lambda: "10.0.0.0/16", Question),
+        (typing.Union[ipaddress.IPv4Address, int], lambda: _ip(rng), Question),
+        (ipaddress.IPv4Address | int, lambda: str(rng.randrange(100)), Question),
+        (
+            list[ipaddress.IPv4Address],
+            lambda: ", ".join(_ip(rng) for _ in range(rng.randrange(1, 5))),
+            ListQuestion,
+        ),
+        (
+            list[typing.Union[int, ipaddress.IPv4Address]],
+            lambda: ",".join(rng.choice([_ip(rng), "7"]) for _ in range(3)),
+            ListQuestion,
+        ),
+    ]
+    failures = []
+    for run in range(runs):
+        field_type, make_valid, question_cls = rng.choice(cases)
+        valid = make_valid()
+        answers = [rng.choice(_INVALID[1:]) for _ in range(rng.randrange(3))]
+        answers.append(valid)
+        questionaire = ScriptedQuestionaire(
+            lambda text, answers=iter(answers): next(answers), max_answers=10
+        )
+        question = question_cls(text="fuzz", field="fuzz")
+        try:
+            answer = questionaire._matches_type(question, field_type)
+            if typing.get_origin(field_type) is list:
+                expected = [a.strip() for a in valid.split(",")]
+                assert [str(a) for a in answer] == expected, (answer, valid)
+            else:
+                assert str(answer) == valid, (answer, valid)
+        except Exception as e:
+            failures.append((run, field_type, answers, repr(e)))
+    return failures
+
+
+def _plain(value):
+    """Return what Ansible should read back for a value of the inventory."""
+    if isinstance(value, NoOmitItems):
+        return {key: _plain(v) for key, v in value}
+    if isinstance(value, enum.Enum):
+        return _plain(value.value)
+    if isinstance(value, dict):
+        return {key: _plain(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _load_as_ansible(exported):
+    # Ansible reads inventories with YAML 1.1 rules, under which e.g. an
+    # unquoted MAC address is a sexagesimal int rather than a string
+    return yaml.load(exported, yaml.SafeLoader, version=(1, 1))
+
+
+def _assert_same(loaded, expected, where):
+    loaded = loaded or {}
+    assert loaded.keys() == expected.keys(), (where, loaded.keys(), expected.keys())
+    for key, value in expected.items():
+        assert loaded[key] == value, (where, key, loaded[key], value)
+
+
+def _hosts(loaded, *path):
+    node = loaded["all"]["children"]
+    for key in path:
+        node = node.get(key) or {}
+    return node.get("hosts") or {}
+
+
+def check_round_trip(inventory):
+    """Export the inventory, load it back as Ansible does and compare values."""
+    loaded = _load_as_ansible(InventoryExporter(inventory).export())
+    for name in ("bastions", "services", "vm_hosts"):
+        for host_name, host in _hosts(loaded, name).items():
+            expected = getattr(inventory, name).hosts[host_name]
+            _assert_same(host, _plain(NoOmitItems(expected)), f"{name}.{host_name}")
+        assert _hosts(loaded, name).keys() == getattr(inventory, name).hosts.keys()
+
+    for role, group in (("master", "masters"), ("worker", "workers")):
+        expected = {
+            node.name: _plain(NoOmitItems(node))
+            for node in inventory.nodes.iter_hosts()
+            if node.role.value == role
+        }
+        loaded_nodes = _hosts(loaded, "nodes", "children", group)
+        assert loaded_nodes.keys() == expected.keys(), group
+        for name, values in expected.items():
+            _assert_same(loaded_nodes[name], values, f"{group}.{name}")
+
+    parts_ = inventory.all_section.parts.values()
+    _assert_same(loaded["all"]["vars"], _plain(NoOmitItems(*parts_)), "all.vars")
+    return loaded
+
+
+def headless(rng, runs):
+    """Run the questionaire on random answer sets and round trip the result."""
+    failures = []
+    for run in range(runs):
+        questionaire = ScriptedQuestionaire(RandomAnswers(rng))
+        try:
+            questionaire.run()
+            check_round_trip(questionaire.inventory)
+        except Exception as e:
+            failures.append((run, questionaire.prompts[-3:], repr(e)))
+    return failures
+
+
+@dataclasses.dataclass
+class Bastion:
+    # parts has no bastion host class, the exporter only needs a dataclass
+    name: str
+    ansible_host: ipaddress.IPv4Address
+    ansible_user: typing.Any = OMIT
+
+
+def _random_value(rng, field_type, name):
+    origin = typing.get_origin(field_type)
+    if origin in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(field_type) if arg is not type(None)]
+        return _random_value(rng, rng.choice(args), name)
+    if origin is list:
+        (item_type,) = typing.get_args(field_type)
+        return [_random_value(rng, item_type, name) for _ in range(rng.randrange(1, 4))]
+    if name == "mac":
+        return _mac(rng)
+    if name == "network_config":
+        return {"interfaces": [{"name": "eno1", "type": "ethernet"}]}
+    if not isinstance(field_type, type):
+        return _word(rng)
+    if issubclass(field_type, enum.Enum):
+        return rng.choice(list(field_type))
+    if issubclass(field_type, bool):
+        return rng.random() < 0.5
+    if issubclass(field_type, int):
+        return rng.randrange(1, 4095)
+    if issubclass(field_type, ipaddress.IPv4Address):
+        return ipaddress.IPv4Address(_ip(rng))
+    if issubclass(field_type, ipaddress.IPv4Network):
+        return ipaddress.IPv4Network(f"10.{rng.randrange(256)}.0.0/16")
+    if dataclasses.is_dataclass(field_type):
+        return _random_part(rng, field_type)
+    return _word(rng)
+
+
+def _random_part(rng, cls, omit_rate=0.5, **values):
+    """Build a parts object from ``values`` and random values for the rest.
+
+    Fields which default to OMIT are left out ``omit_rate`` of the time,
+    other defaulted fields are kept half of the time.
+    """
+    hints = typing.get_type_hints(cls)
+    for field in dataclasses.fields(cls):
+        if field.name in values or not field.init:
+            continue
+        required = (
+            field.default is dataclasses.MISSING
+            and field.default_factory is dataclasses.MISSING
+        )
+        if field.default is OMIT:
+            if rng.random() < omit_rate:
+                continue
+        elif not required and rng.random() < 0.5:
+            continue
+        values[field.name] = _random_value(rng, hints[field.name], field.name)
+    return cls(**values)
+
+
+SERVICES = {
+    "ntp_host": parts.services.NTPHost,
+    "dns_host": parts.services.DNSHost,
+    "http_store": parts.services.HTTPStore,
+    "registry_host": parts.services.RegistryHost,
+    "assisted_installer": parts.services.AssistedInstaller,
+    "tftp_host": parts.services.TFTPHost,
+}
+
+
+def build_inventory(rng, masters, workers, vm_hosts, services, bastions):
+    """Build an inventory of random hosts, about half of them VM nodes.
+
+    Nodes refer to random VM hosts, which may not exist, and optional
+    fields are left OMIT at random. Nothing is validated on insertion.
+    """
+    inventory = Inventory()
+    inventory.all_section.add_part(
+        "crucible_config", _random_part(rng, parts.CrucibleConfig)
+    )
+    inventory.all_section.add_part(
+        "cluster_definition", _random_part(rng, parts.ClusterDefinition)
+    )
+    for i in range(bastions):
+        inventory.bastions.add_host(
+            _random_part(rng, Bastion, name=f"bastion{i}"), validate=False
+        )
+    for name in rng.sample(sorted(SERVICES), services):
+        inventory.services.add_host(
+            _random_part(rng, SERVICES[name], name=name), validate=False
+        )
+    for i in range(vm_hosts):
+        inventory.vm_hosts.add_host(
+            _random_part(rng, parts.VMHost, name=f"vm_host{i}"), validate=False
+        )
+
+    roles = [parts.node.Roles.master] * masters + [parts.node.Roles.worker] * workers
+    for i, role in enumerate(roles):
+        values = {
+            "name": f"node{i}",
+            "role": role,
+            "ansible_host": ipaddress.IPv4Address(0x0A000000 + i + 1),
+        }
+        if rng.random() < 0.5:
+            host_cls = parts.node.VMNode
+            values["vm_host"] = f"vm_host{rng.randrange(vm_hosts + 1)}"
+        else:
+            host_cls = parts.node.Node
+        inventory.nodes.children.groups[role].add_host(
+            _random_part(rng, host_cls, **values), validate=False
+        )
+    return inventory
+
+
+def _random_shape(rng, scale):
+    """(masters, workers, vm_hosts, services, bastions) of about scale hosts."""
+    return (
+        rng.choice([1, 2, 3, 5]),
+        rng.randrange(scale // 2, scale + 1),
+        rng.randrange(scale // 100 + 2),
+        rng.randrange(len(SERVICES) + 1),
+        rng.randrange(3),
+    )
+
+
+SCALES = [1, 10, 100, 1_000, 10_000]
+
+
+def shapes(rng, runs):
+    """Round trip random small inventories, then time random ones per scale.
+
+    Records the validation and export throughput and the export's peak
+    memory for one random shape per scale in ``SCALES``.
+    """
+    failures = []
+    for run in range(runs):
+        shape = _random_shape(rng, rng.choice([1, 10, 50]))
+        try:
+            check_round_trip(build_inventory(rng, *shape))
+        except Exception as e:
+            failures.append((run, shape, repr(e)))
+
+    print(
+        f"{'masters':>7} {'workers':>8} {'vm_hosts':>8} {'services':>8} "
+        f"{'bastions':>8} {'validate/s':>11} {'round trip/s':>12} "
+        f"{'export peak MiB':>15}"
+    )
+    for scale in SCALES:
+        shape = _random_shape(rng, scale)
+        inventory = build_inventory(rng, *shape)
+        hosts = sum(shape)
+
+        start = time.perf_counter()
+        inventory.report()
+        validate_rate = hosts / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            check_round_trip(inventory)
+        except Exception as e:
+            failures.append((scale, shape, repr(e)))
+        export_rate = hosts / (time.perf_counter() - start)
+
+        # Separate pass as tracing allocations slows the export down a lot
+        tracemalloc.start()
+        InventoryExporter(inventory).export()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            *(f"{count:>{width}}" for count, width in zip(shape, (7, 8, 8, 8, 8))),
+            f"{validate_rate:>11.0f} {export_rate:>12.0f} {peak / 2**20:>15.1f}",
+        )
+    return failures
+
+
+STAGES = {"fuzz-types": fuzz_types, "headless": headless, "shapes": shapes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stages", nargs="*", metavar="stage", help=", ".join(STAGES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    if unknown := set(args.stages) - STAGES.keys():
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    args.stages = args.stages or list(STAGES)
+
+    failed = False
+    for stage in args.stages:
+        rng = random.Random(args.seed)
+        failures = STAGES[stage](rng, args.runs)
+        print(f"{stage}: {len(failures)} failure(s) (seed {args.seed})")
+        for failure in failures[:10]:
+            print("  ", *failure)
+        failed = failed or len(failures) > 0
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
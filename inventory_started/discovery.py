@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import base64
+import http.client
+import json
+import os
+import ssl
+import typing
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from . import parts
+
+
+class RedfishError(Exception):
+    @classmethod
+    def new(cls, address, reason):
+        return cls(f"Redfish discovery of {address} failed: {reason}")
+
+
+@dataclass(frozen=True)
+class HardwareFacts:
+    manufacturer: str = ""
+    model: str = ""
+    serial_number: str = ""
+    boot_mac: typing.Optional[str] = None
+    memory_gib: typing.Optional[float] = None
+    cpu_count: typing.Optional[int] = None
+
+    @property
+    def vendor(self) -> typing.Optional[parts.node.Vendors]:
+        manufacturer = self.manufacturer.lower()
+        for vendor in parts.node.Vendors:
+            if vendor.value.lower() in manufacturer:
+                return vendor
+        return None
+
+
+@dataclass(frozen=True)
+class BMC:
+    address: str
+    user: str
+    password: str
+
+
+def _parse_address(address: str):
+    """Split a bmc_address such as ``redfish-virtualmedia+https://host/path``.
+
+    Redfish and iDRAC schemes use https unless they name a transport with
+    ``+http``/``+https``. Other BMC schemes (e.g. ``ipmi``) are rejected.
+    """
+    if "://" not in address:
+        address = f"https://{address}"
+    scheme, rest = address.split("://", 1)
+    driver, _, transport = scheme.partition("+")
+    if driver in ("http", "https") and not transport:
+        transport = driver
+    elif driver.startswith(("redfish", "idrac")) or driver.endswith("-redfish"):
+        transport = transport or "https"
+    if transport not in ("http", "https"):
+        raise RedfishError.new(address, f"unsupported BMC scheme {scheme}")
+    url = urllib.parse.urlsplit(f"{transport}://{rest}")
+    return url.scheme, url.hostname, url.port, url.path
+
+
+class RedfishClient:
+    """Redfish client which reuses a single keep-alive connection to one BMC."""
+
+    def __init__(self, bmc: BMC, verify=True, timeout=10) -> None:
+        self.bmc = bmc
+        scheme, host, port, path = _parse_address(bmc.address)
+        self._system_path = path if "/redfish/v1/Systems/" in path else None
+        if scheme == "https":
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._conn = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=context
+            )
+        else:
+            self._conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        token = base64.b64encode(f"{bmc.user}:{bmc.password}".encode()).decode()
+        self._headers = {
+            "Authorization": f"Basic {token}",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, path: str) -> dict:
+        self._conn.request("GET", path, headers=self._headers)
+        response = self._conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RedfishError.new(
+                self.bmc.address, f"GET {path} returned {response.status}"
+            )
+        return json.loads(body)
+
+    def _members(self, path: str) -> list[str]:
+        return [member["@odata.id"] for member in self.get(path).get("Members", [])]
+
+    def _boot_mac(self, system: dict) -> typing.Optional[str]:
+        if "EthernetInterfaces" not in system:
+            return None
+        interfaces = [
+            self.get(path)
+            for path in self._members(system["EthernetInterfaces"]["@odata.id"])
+        ]
+        macs = [i for i in interfaces if i.get("MACAddress")]
+        for interface in macs:
+            if interface.get("LinkStatus") == "LinkUp":
+                return interface["MACAddress"].lower()
+        return macs[0]["MACAddress"].lower() if macs else None
+
+    def discover(self) -> HardwareFacts:
+        system_path = self._system_path
+        if system_path is None:
+            systems = self._members("/redfish/v1/Systems")
+            if len(systems) == 0:
+                raise RedfishError.new(self.bmc.address, "no systems found")
+            system_path = systems[0]
+        system = self.get(system_path)
+        return HardwareFacts(
+            manufacturer=system.get("Manufacturer") or "",
+            model=system.get("Model") or "",
+            serial_number=system.get("SerialNumber") or "",
+            boot_mac=self._boot_mac(system),
+            memory_gib=system.get("MemorySummary", {}).get("TotalSystemMemoryGiB"),
+            cpu_count=system.get("ProcessorSummary", {}).get("Count"),
+        )
+
+
+class DiscoveryCache:
+    """Discovered facts keyed by BMC address, optionally persisted as JSON.
+
+    The file is only read when the cache is first used. A missing,
+    unreadable or outdated file is treated as an empty cache.
+    """
+
+    def __init__(self, path: typing.Optional[Path] = None) -> None:
+        self.path = path
+        self._facts: typing.Optional[dict[str, HardwareFacts]] = None
+
+    def _load(self) -> dict[str, HardwareFacts]:
+        if self._facts is None:
+            self._facts = {}
+            if self.path is not None:
+                try:
+                    with self.path.open() as f:
+                        self._facts = {
+                            k: HardwareFacts(**v) for k, v in json.load(f).items()
+                        }
+                except (OSError, ValueError, TypeError, AttributeError):
+                    pass
+        return self._facts
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("w") as f:
+                json.dump({k: asdict(v) for k, v in self._facts.items()}, f)
+        except OSError:
+            # The cache only saves BMC queries, failing to write it is not fatal
+            pass
+
+    @staticmethod
+    def default_path() -> Path:
+        cache_home = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+        return Path(cache_home) / "inventory_started" / "redfish.json"
+
+    def get(self, address: str) -> typing.Optional[HardwareFacts]:
+        return self._load().get(address)
+
+    def update(self, facts: dict[str, HardwareFacts]):
+        self._load().update(facts)
+        self._save()
+
+    def invalidate(self, address: str):
+        if self._load().pop(address, None) is not None:
+            self._save()
+
+
+def _discover_one(bmc: BMC, verify, timeout) -> HardwareFacts:
+    with RedfishClient(bmc, verify=verify, timeout=timeout) as client:
+        return client.discover()
+
+
+def discover(
+    bmcs: typing.Iterable[BMC],
+    cache: DiscoveryCache = None,
+    max_workers=64,
+    verify=True,
+    timeout=10,
+    refresh=False,
+) -> dict[str, typing.Union[HardwareFacts, Exception]]:
+    """Query every BMC concurrently, returning facts (or the error) by address.
+
+    TLS certificates are verified unless ``verify`` is False, which should
+    only be used for BMCs with self signed certificates.
+
+    BMCs already in ``cache`` are not queried again unless ``refresh`` is set,
+    in which case they are queried and the cache is updated.
+    """
+    results = {}
+    pending = []
+    for bmc in bmcs:
+        if (
+            cache is not None
+            and not refresh
+            and (facts := cache.get(bmc.address)) is not None
+        ):
+            results[bmc.address] = facts
+        else:
+            pending.append(bmc)
+
+    if len(pending) > 0:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+            futures = {
+                bmc.address: pool.submit(_discover_one, bmc, verify, timeout)
+                for bmc in pending
+            }
+        discovered = {}
+        for address, future in futures.items():
+            try:
+                discovered[address] = future.result()
+            except Exception as e:
+                results[address] = e
+        if cache is not None:
+            cache.update(discovered)
+        results.update(discovered)
+    return results
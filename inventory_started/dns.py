@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import ipaddress
+from dataclasses import dataclass
+
+from ruamel import yaml
+
+from . import parts
+from .inventory import Inventory, InventoryDumper
+from .omit import OMIT, NoOmitItems
+
+
+class DuplicateRecord(Exception):
+    @classmethod
+    def new(cls, kind, key, first, second):
+        return cls(f"{kind} {key} is used by both {first} and {second}")
+
+
+@dataclass(frozen=True)
+class Record:
+    name: str
+    type: str
+    value: str
+
+
+@dataclass(frozen=True)
+class Lease:
+    mac: str
+    ip: str
+    hostname: str
+
+
+def _address_record(name, address) -> Record:
+    address = ipaddress.ip_address(str(address))
+    return Record(name, "A" if address.version == 4 else "AAAA", str(address))
+
+
+class ZoneData:
+    """DNS records and DHCP static leases precomputed from an inventory.
+
+    Built in a single pass over the nodes so the playbooks can consume the
+    records directly rather than looping over every host in Jinja.
+    """
+
+    def __init__(self, domain: str) -> None:
+        self.domain = domain
+        self.records: list[Record] = []
+        self.leases: list[Lease] = []
+        self.by_mac: dict[str, Lease] = {}
+        self.by_ip: dict[str, Record] = {}
+
+    def fqdn(self, name):
+        return f"{name}.{self.domain}"
+
+    def add_address(self, name, address, reverse=True):
+        record = _address_record(self.fqdn(name), address)
+        self.records.append(record)
+        if reverse:
+            if (other := self.by_ip.get(record.value)) is not None:
+                raise DuplicateRecord.new("IP", record.value, other.name, record.name)
+            self.by_ip[record.value] = record
+            self.records.append(
+                Record(
+                    ipaddress.ip_address(record.value).reverse_pointer,
+                    "PTR",
+                    f"{record.name}.",
+                )
+            )
+        return record
+
+    def add_lease(self, mac, address, name):
+        lease = Lease(str(mac).lower(), str(address), self.fqdn(name))
+        if (other := self.by_mac.get(lease.mac)) is not None:
+            raise DuplicateRecord.new("MAC", lease.mac, other.hostname, lease.hostname)
+        self.by_mac[lease.mac] = lease
+        self.leases.append(lease)
+        return lease
+
+    @classmethod
+    def from_inventory(cls, inventory: Inventory) -> ZoneData:
+        cluster = inventory.all_section.parts["cluster_definition"]
+        zone = cls(f"{cluster.cluster_name}.{cluster.base_dns_domain}")
+
+        zone.add_address("api", cluster.api_vip)
+        # api-int shares the api VIP, so only api gets the PTR record
+        zone.add_address("api-int", cluster.api_vip, reverse=False)
+        zone.add_address("*.apps", cluster.ingress_vip, reverse=False)
+
+        api_vip = ipaddress.ip_address(str(cluster.api_vip))
+        nodes = list(inventory.nodes.iter_hosts())
+        sno = len(nodes) == 1 and nodes[0].role == parts.node.Roles.master
+        for node in nodes:
+            address = ipaddress.ip_address(str(node.ansible_host))
+            # On SNO the api VIP is the node's own address, which already has
+            # its PTR record. Any other shared address is a duplicate.
+            zone.add_address(
+                node.name, address, reverse=not (sno and address == api_vip)
+            )
+            if node.mac is not OMIT:
+                zone.add_lease(node.mac, node.ansible_host, node.name)
+        return zone
+
+    def asvars(self) -> dict:
+        return {
+            "dns_zone": {
+                "domain": self.domain,
+                "records": [NoOmitItems(record) for record in self.records],
+            },
+            "dhcp_static_leases": {
+                lease.mac: NoOmitItems(lease) for lease in self.leases
+            },
+        }
+
+    def export(self, func=yaml.dump, Dumper=InventoryDumper):
+        """Export the zone as a standalone vars file."""
+        return func(self.asvars(), Dumper=Dumper)
@@ -1,11 +1,15 @@
 from __future__ import annotations
-from collections import defaultdict
+import dataclasses
+import enum
+import ipaddress
+from collections import ChainMap, defaultdict
 from functools import lru_cache
-from tokenize import group
 
 from ruamel import yaml
 
+from .omit import NoOmitDict, NoOmitItems
 from .parts.base import ValidationBase
+from .rules import ValidationReport, default_rules
 
 
 class CanNotInsertInvalidValue(Exception):
@@ -15,21 +19,30 @@ class CanNotInsertInvalidValue(Exception):
 
 
 class Group(ValidationBase):
-    def __init__(self, vars=None, hosts=None, children=None) -> None:
+    def __init__(self, vars=None, hosts=None, children=None, base=None) -> None:
         self.vars = vars or []
         self.hosts = hosts or {}
+        if base is not None:
+            self.hosts = ChainMap(self.hosts, base.hosts)
         self.children: GroupList = children or GroupList()
         super().__init__()
 
-    def validate(self, inventory: Inventory):
-        for var_secton in vars:
-            var_secton.validate(inventory)
-
-        for host in self.hosts.values():
-            host.validate(inventory)
-
-        for child in self.children.values():
-            child.validate(inventory)
+    @property
+    def own_hosts(self):
+        """Hosts set on this group, excluding those inherited from a base."""
+        if isinstance(self.hosts, ChainMap):
+            return self.hosts.maps[0]
+        return self.hosts
+
+    def overlay(self) -> Group:
+        """Return a copy-on-write group which shares this group's hosts."""
+        return type(self)(
+            vars=list(self.vars),
+            children=GroupList(
+                {name: child.overlay() for name, child in self.children.groups.items()}
+            ),
+            base=self,
+        )
 
     def add_var_section(self, section, validate=True):
         if validate and not section.validate(self):
@@ -44,31 +57,63 @@ class Group(ValidationBase):
     def add_child(self, group: Group):
         self.children[group.name] = group
 
+    def _group_of(self, name):
+        if name in self.hosts:
+            return self
+        for child in self.children.groups.values():
+            if (group := child._group_of(name)) is not None:
+                return group
+        return None
+
+    def update_host(self, name, **changes):
+        """Replace a host, which may be in a child group, on this group only."""
+        if (group := self._group_of(name)) is None:
+            raise KeyError(name)
+        group.hosts[name] = dataclasses.replace(group.hosts[name], **changes)
+
+    def iter_hosts(self, own_only=False):
+        yield from (self.own_hosts if own_only else self.hosts).values()
+        for child in self.children.groups.values():
+            yield from child.iter_hosts(own_only=own_only)
+
     def __len__(self):
-        return len(self.hosts) + sum(len(child) for child in self.children)
+        return len(self.hosts) + sum(
+            len(child) for child in self.children.groups.values()
+        )
 
 
 class GroupList:
     def __init__(self, groups=None) -> None:
-        self.groups: dict[str, Group] = defaultdict(Group)
+        self.groups: dict[str, Group] = defaultdict(Group, groups or {})
 
 
 class NodeGroup(Group):
-    def validate(self, inventory: Inventory):
-        if not ((self.children["masters"]) == 1 or ((self.children["masters"]) >= 3)):
-            return False
-        return super().validate(inventory)
+    """The nodes group, checked by the ``nodes`` rules of ``default_rules``."""
 
 
 class VarsSection(ValidationBase):
-    def __init__(self, required=None) -> None:
+    def __init__(self, required=None, base=None) -> None:
         self.required = required or []
-        self.parts = {}
+        self.parts = {} if base is None else ChainMap({}, base.parts)
         super().__init__()
 
+    @property
+    def own_parts(self):
+        """Parts set on this section, excluding those inherited from a base."""
+        if isinstance(self.parts, ChainMap):
+            return self.parts.maps[0]
+        return self.parts
+
+    def overlay(self) -> VarsSection:
+        """Return a copy-on-write section which shares this section's parts."""
+        return VarsSection(required=self.required, base=self)
+
     def add_part(self, name, part):
         self.parts[name] = part
 
+    def update_part(self, name, **changes):
+        self.parts[name] = dataclasses.replace(self.parts[name], **changes)
+
 
 class Inventory(ValidationBase):
     def __init__(
@@ -79,33 +124,96 @@ class Inventory(ValidationBase):
         vm_hosts: Group = None,
         nodes: NodeGroup = None,
     ) -> None:
-        self.all_section = all_section or VarsSection()
-        self.bastions = bastions or Group()
-        self.services = services or Group()
-        self.vm_hosts = vm_hosts or Group()
-        self.nodes = nodes or NodeGroup()
+        # Explicit None checks as an empty (possibly overlaid) group is falsy
+        self.all_section = VarsSection() if all_section is None else all_section
+        self.bastions = Group() if bastions is None else bastions
+        self.services = Group() if services is None else services
+        self.vm_hosts = Group() if vm_hosts is None else vm_hosts
+        self.nodes = NodeGroup() if nodes is None else nodes
         super().__init__()
 
     def validate(self):
         with self._validation_context:
-            return all(
-                x.vaildate(self)
-                for x in (
-                    self.all_section,
-                    self.bastions,
-                    self.services,
-                    self.vm_hosts,
-                    self.nodes,
-                )
-            )
+            return self.report().ok
+
+    def overlay(self) -> Inventory:
+        """Return a variant of this inventory which shares all of its parts and hosts.
+
+        Parts and hosts are only copied when they are changed on the overlay
+        (see ``update_part``/``update_host``) so many cluster variants can be
+        built from one base inventory.
+        """
+        return Inventory(
+            all_section=self.all_section.overlay(),
+            bastions=self.bastions.overlay(),
+            services=self.services.overlay(),
+            vm_hosts=self.vm_hosts.overlay(),
+            nodes=self.nodes.overlay(),
+        )
+
+    def report(self, executor=None) -> ValidationReport:
+        """Run every registered rule and collect all violations."""
+        return default_rules.validate(self, executor=executor)
+
+
+class InventoryDumper(yaml.SafeDumper):
+    """Dumper which represents parts objects from their non-OMIT fields."""
+
+    # Ansible loads inventories with YAML 1.1 rules, so resolve with those to
+    # quote scalars such as MAC addresses which 1.1 reads as sexagesimal ints.
+    yaml_implicit_resolvers = {}
+
+    def ignore_aliases(self, data):
+        # Parts share value objects (e.g. an SNO node's address is also the
+        # api_vip) which must not be emitted as anchors and aliases
+        return True
+
+
+for _versions, *_resolver in yaml.resolver.implicit_resolvers:
+    if (1, 1) in _versions:
+        InventoryDumper.add_implicit_resolver_base(*_resolver)
+
+
+def _represent_no_omit(dumper, data):
+    return dumper.represent_mapping("tag:yaml.org,2002:map", iter(data))
+
+
+def _represent_as_str(dumper, data):
+    return dumper.represent_str(str(data))
+
+
+InventoryDumper.add_representer(NoOmitItems, _represent_no_omit)
+InventoryDumper.add_representer(NoOmitDict, yaml.SafeDumper.represent_dict)
+InventoryDumper.add_multi_representer(
+    enum.Enum, lambda dumper, data: dumper.represent_data(data.value)
+)
+for _cls in (
+    ipaddress.IPv4Address,
+    ipaddress.IPv6Address,
+    ipaddress.IPv4Network,
+    ipaddress.IPv6Network,
+    ipaddress.IPv4Interface,
+    ipaddress.IPv6Interface,
+):
+    InventoryDumper.add_representer(_cls, _represent_as_str)
 
 
 class InventoryExporter:
-    def __init__(self, inventory: Inventory) -> None:
+    """Export an inventory as an ansible YAML inventory.
+
+    With ``overlay_only`` only the parts and hosts set on an overlay are
+    emitted, so the base inventory can be exported once and combined with
+    each cluster's file (``ansible -i base.yml -i cluster.yml``). Passing a
+    ``dns.ZoneData`` adds its records and leases to the ``all`` vars.
+    """
+
+    def __init__(self, inventory: Inventory, overlay_only=False, zone_data=None):
         self.inventory = inventory
+        self.overlay_only = overlay_only
+        self.zone_data = zone_data
 
-    def export(self, func=yaml.dump):
-        return func(self._asdict)
+    def export(self, func=yaml.dump, Dumper=InventoryDumper):
+        return func(self._asdict, Dumper=Dumper)
 
     @property
     def _asdict(self):
@@ -113,10 +221,10 @@ class InventoryExporter:
             "bastions": self._bastions,
             "services": self._services,
         }
-        if len(vm_hosts := self._vm_hosts) > 0:
-            groups["vm_hosts"] = vm_hosts
+        if len(self._hosts(self.inventory.vm_hosts)) > 0:
+            groups["vm_hosts"] = self._vm_hosts
 
-        group["nodes"] = self._nodes
+        groups["nodes"] = self._nodes
         return {
             "all": {
                 "vars": self._all_vars,
@@ -126,10 +234,11 @@ class InventoryExporter:
 
     @property
     def _all_vars(self):
-        res = {}
-        for part in self.inventory.all_section.parts:
-            res.update(part.asdict())
-        return res
+        all_section = self.inventory.all_section
+        parts = all_section.own_parts if self.overlay_only else all_section.parts
+        if self.zone_data is not None:
+            return NoOmitItems(*parts.values(), self.zone_data.asvars())
+        return NoOmitItems(*parts.values())
 
     @property
     def _nodes(self):
@@ -148,13 +257,20 @@ class InventoryExporter:
 
     @property
     def _nodes_by_group(self):
-        res = {"masters": {}, "workers": {}}
-        for node in self.inventory.nodes.hosts:
-            res[node.role.value][node.name] = node.asdict()
+        res = {"master": {}, "worker": {}}
+        for node in self.inventory.nodes.iter_hosts(own_only=self.overlay_only):
+            res[node.role.value][node.name] = NoOmitItems(node)
         return res
 
+    def _hosts(self, group):
+        return group.own_hosts if self.overlay_only else group.hosts
+
     def _get_host_from_group(self, group):
-        return {"hosts": {service.name: service.asdict() for service in group.hosts}}
+        return {
+            "hosts": {
+                host.name: NoOmitItems(host) for host in self._hosts(group).values()
+            }
+        }
 
     @property
     def _services(self):
@@ -166,4 +282,4 @@ class InventoryExporter:
 
     @property
     def _bastions(self):
-        return self._get_host_from_group(self.inventory.vm_hosts)
+        return self._get_host_from_group(self.inventory.bastions)
@@ -1,13 +1,14 @@
 import itertools
+import subprocess
 import tempfile
 import typing
-from asyncio import subprocess
 from dataclasses import dataclass
 
 from ruamel import yaml
 
-from . import parts
+from . import discovery, parts
 from .inventory import Inventory
+from .nmstate import InvalidNetworkConfig, NetworkConfigTemplates
 
 
 @dataclass
@@ -26,13 +27,29 @@ class Question:
 
 
 @dataclass
-class ListQuestion:
+class ListQuestion(Question):
     delimeter: str = ","
 
 
 class Questionaire:
+    _network_config_questions = {
+        "vm_bridge_ip": Question(
+            field="vm_bridge_ip",
+            text="What is the expected IP address of the VM bridge",
+        ),
+        "vm_bridge_interface": Question(
+            field="vm_bridge_interface",
+            text="Which interface do you wish the bridge to connect to",
+        ),
+        "vm_vlan_tag": Question(field="vm_vlan_tag", text="What is that vlan tag"),
+    }
+
     def __init__(self):
         self.inventory = Inventory()
+        self.network_config_templates = NetworkConfigTemplates(parts.VMHost)
+        self.discovery_cache = discovery.DiscoveryCache(
+            discovery.DiscoveryCache.default_path()
+        )
 
     def run(self):
 
@@ -86,30 +103,35 @@ class Questionaire:
                         break
                     except Exception as e:
                         exceptions.append(str(e))
-                if len(exceptions) > 0:
+                if answer is None and len(exceptions) > 0:
                     exc_str = "\n".join(exceptions)
                     self._output(f"Not able to find correct type:\n{exc_str}")
             elif typing.get_origin(filed_type) is list and isinstance(
                 question, ListQuestion
             ):
+                (item_type,) = typing.get_args(filed_type)
+                if typing.get_origin(item_type) in _union:
+                    sub_types = typing.get_args(item_type)
+                else:
+                    sub_types = (item_type,)
                 exceptions = []
                 values = []
-                continue_evaluating = True
                 for answer_part in answer_candidate.split(question.delimeter):
-                    for sub_type in typing.get_args(filed_type):
+                    part_exceptions = []
+                    for sub_type in sub_types:
                         try:
-                            values.append(sub_type(answer_part))
+                            values.append(sub_type(answer_part.strip()))
                             break
                         except Exception as e:
-                            exceptions.append(str(e))
-                        if len(exceptions) > 0:
-                            continue_evaluating = False
-                            break
-                    if not continue_evaluating:
+                            part_exceptions.append(str(e))
+                    else:
+                        exceptions = part_exceptions
                         break
                 if len(exceptions) > 0:
                     exc_str = "\n".join(exceptions)
                     self._output(f"Not able to find correct type:\n{exc_str}")
+                else:
+                    answer = values
             else:
                 try:
                     answer = filed_type(answer_candidate)
@@ -145,6 +167,33 @@ class Questionaire:
         values.update(self._prepare_using_types_and_questions(questions, host_cls))
         return values
 
+    def _edit_network_config(self):
+        with tempfile.NamedTemporaryFile(mode="r", suffix=".yaml") as tmpfile:
+            subprocess.run(f"${{EDITOR:-vi}} {tmpfile.name}", shell=True)
+            with open(tmpfile.name) as f:
+                return f.read()
+
+    def _get_network_config_template(self):
+        templates = list(self.network_config_templates)
+        if len(templates) > 0 and self._yes_or_no_bool(
+            Question(
+                text="Do you want to reuse the previous nmstate template [Y/n]",
+                default="yes",
+            )
+        ):
+            return templates[-1]
+
+        self._output(
+            "Use ${name} placeholders (e.g. ${vm_bridge_ip}) for per host values "
+            "and $$ for a literal $"
+        )
+        while True:
+            content = self._edit_network_config()
+            try:
+                return self.network_config_templates.get(content)
+            except (InvalidNetworkConfig, yaml.YAMLError) as e:
+                self._output(e)
+
     def _prepare_vm_host_networking(self):
         if self._yes_or_no_bool(
             Question(
@@ -152,28 +201,23 @@ class Questionaire:
                 default="no",
             )
         ):
-            with tempfile.NamedTemporaryFile() as tmpfile:
-                EDITOR = "${EDITOR:-vi}"
-                subprocess.run(f"{EDITOR} {tmpfile.name}", shell=True)
-                network_config_content = tmpfile.read()
-                # TODO: allow for blank or all comments then re-ask.
-                # TODO: add some validation here for now assume its good.
-                nc_values = yaml.load_all(network_config_content, yaml.SafeLoader)
-                # This will allow for some templating by allowing them to define extra values
-                if "network_config" in network_config_content:
-                    values.update(**nc_values)
-                else:
-                    values["network_config"] = network_config_content
+            template = self._get_network_config_template()
+            questions = [
+                self._network_config_questions.get(
+                    variable, Question(field=variable, text=f"Value for {variable}")
+                )
+                for variable in sorted(template.variables)
+            ]
+            variables = self._prepare_using_types_and_questions(questions, parts.VMHost)
+            host_fields = typing.get_type_hints(parts.VMHost)
+            values = {k: v for k, v in variables.items() if k in host_fields}
+            # Extra values defined alongside network_config win over answers
+            values.update(template.render(**variables))
+            return values
         else:
             questions = [
-                Question(
-                    field="vm_bridge_ip",
-                    text="What is the expected IP address of the VM bridge",
-                ),
-                Question(
-                    field="vm_bridge_interface",
-                    text="Which interface do you wish the bridge to connect to",
-                ),
+                self._network_config_questions["vm_bridge_ip"],
+                self._network_config_questions["vm_bridge_interface"],
                 Question(field="dns", text="Which dns server should the bridge use"),
             ]
             values = self._prepare_using_types_and_questions(questions, parts.VMHost)
@@ -185,7 +229,7 @@ class Questionaire:
             ):
                 values.update(
                     self._prepare_using_types_and_questions(
-                        Question(field="vm_vlan_tag", text="What is that vlan tag"),
+                        self._network_config_questions["vm_vlan_tag"],
                         parts.VMHost,
                     )
                 )
@@ -311,16 +355,19 @@ class Questionaire:
         ]
 
         if self._is_sno:
-            questions += [
-                Question(field="api_vip", text="API VIP"),
-                Question(field="ingress_vip", text="Ingress VIP"),
-            ]
-        else:
-            node_values = self._prepare_node(self, role="master")
+            # The VIPs of a single node cluster are the node's own address
+            (node_values,) = self._add_nodes(
+                [self._prepare_node(role=parts.node.Roles.master)]
+            )
             values.update(
                 api_vip=node_values["ansible_host"],
                 ingress_vip=node_values["ansible_host"],
             )
+        else:
+            questions += [
+                Question(field="api_vip", text="API VIP"),
+                Question(field="ingress_vip", text="Ingress VIP"),
+            ]
 
         questions += [
             Question(field="machine_network_cidr", text="Machine network CIDR"),
@@ -434,7 +481,7 @@ class Questionaire:
         else:
             values["use_pxe"] = False
 
-        self.inventory
+        self.inventory.services.add_host(parts.services.DNSHost(**values))
         return values
 
     def prepare_http_store_service(self):
@@ -539,21 +586,81 @@ class Questionaire:
         self.inventory.services.add_host(parts.services.TFTPHost(**values))
         return values
 
+    def _discover_hardware(self, nodes):
+        """Discover the facts of all the nodes' BMCs in one concurrent pass."""
+        if not self._yes_or_no_bool(
+            Question(
+                text="Do you want to discover the vendor and mac from the BMCs [y/N]",
+                default="no",
+            )
+        ):
+            return {}
+        verify = self._yes_or_no_bool(
+            Question(
+                text=(
+                    "Verify the TLS certificates of the BMCs, "
+                    "only answer no for self signed ones [Y/n]"
+                ),
+                default="yes",
+            )
+        )
+        bmcs = {
+            values["name"]: discovery.BMC(
+                str(values["bmc_address"]), values["bmc_user"], values["bmc_password"]
+            )
+            for values in nodes
+        }
+        refresh = False
+        cached = sum(
+            1
+            for bmc in bmcs.values()
+            if self.discovery_cache.get(bmc.address) is not None
+        )
+        if cached > 0:
+            refresh = not self._yes_or_no_bool(
+                Question(
+                    text=f"Use the hardware facts cached for {cached} BMC(s) [Y/n]",
+                    default="yes",
+                )
+            )
+        results = discovery.discover(
+            bmcs.values(), cache=self.discovery_cache, verify=verify, refresh=refresh
+        )
+        facts = {}
+        for name, bmc in bmcs.items():
+            if isinstance(result := results[bmc.address], Exception):
+                self._output(result)
+            else:
+                facts[name] = result
+        return facts
+
     def _prepare_node(self, host_cls=None, role: parts.node.Roles = None):
+        """Ask for a node, except for what discovery may fill in (see _add_node)."""
         values = {}
         self._output("Node:")
 
-        if host_cls is None and self._yes_or_no_bool(
-            Question(text="Is the node a VM [y/N]", default="no")
-        ):
-            host_cls = parts.node.VMNode
-        else:
-            host_cls = parts.node.Node
+        if host_cls is None:
+            if self._yes_or_no_bool(
+                Question(text="Is the node a VM [y/N]", default="no")
+            ):
+                host_cls = parts.node.VMNode
+            else:
+                host_cls = parts.node.Node
 
         values.update(self._prepare_host(host_cls=host_cls))
 
         if role is not None:
-            values["role"] = parts.node.Roles.master
+            values["role"] = role
+        else:
+            values.update(
+                self._prepare_using_types_and_questions(
+                    Question(
+                        field="role",
+                        text=f"Role [{','.join(x.value for x in parts.node.Roles)}]",
+                    ),
+                    host_cls=host_cls,
+                )
+            )
 
         values.update(
             self._prepare_using_types_and_questions(
@@ -561,23 +668,12 @@ class Questionaire:
                     Question(field="bmc_address", text="BMC Address"),
                     Question(field="bmc_user", text="BMC user"),
                     Question(field="bmc_password", text="BMC password"),
-                    Question(field="mac", text="Mac address to identify node"),
                 ],
                 host_cls=host_cls,
             ),
         )
 
-        if host_cls is parts.node.Node:
-            values.update(
-                self._prepare_using_types_and_questions(
-                    Question(
-                        field="vendor",
-                        text=f"Vendor [{','.join(x.value for x in parts.node.Vendors)}]",
-                    ),
-                    host_cls=host_cls,
-                )
-            )
-        else:
+        if host_cls is not parts.node.Node:
             values.update(
                 self._prepare_using_types_and_questions(
                     Question(field="vm_host", text=f"VM Host"),
@@ -586,8 +682,10 @@ class Questionaire:
             )
 
             if not self._yes_or_no_bool(
-                text="Do you want to use the defualt vm_spec [Y/n]",
-                default="yes",
+                Question(
+                    text="Do you want to use the defualt vm_spec [Y/n]",
+                    default="yes",
+                )
             ):
                 values["vm_spec"] = parts.node.VMSpec(
                     **self._prepare_using_types_and_questions(
@@ -595,19 +693,62 @@ class Questionaire:
                         parts.node.VMSpec,
                     )
                 )
+        return host_cls, values
+
+    def _add_node(self, host_cls, values, facts=None):
+        if facts is not None and facts.boot_mac is not None:
+            values["mac"] = facts.boot_mac
+        else:
+            self._output(f"Node {values['name']}:")
+            values.update(
+                self._prepare_using_types_and_questions(
+                    Question(field="mac", text="Mac address to identify node"),
+                    host_cls=host_cls,
+                )
+            )
+
+        if host_cls is parts.node.Node:
+            if facts is not None and facts.vendor is not None:
+                values["vendor"] = facts.vendor
+            else:
+                values.update(
+                    self._prepare_using_types_and_questions(
+                        Question(
+                            field="vendor",
+                            text=f"Vendor [{','.join(x.value for x in parts.node.Vendors)}]",
+                        ),
+                        host_cls=host_cls,
+                    )
+                )
 
         self.inventory.nodes.children.groups[values["role"]].add_host(
             host_cls(**values)
         )
         return values
 
+    def _add_nodes(self, pending):
+        """Discover the hardware of the bare metal nodes at once, then add all."""
+        bare_metal = [
+            values for host_cls, values in pending if host_cls is parts.node.Node
+        ]
+        facts = self._discover_hardware(bare_metal) if len(bare_metal) > 0 else {}
+        return [
+            self._add_node(host_cls, values, facts.get(values["name"]))
+            for host_cls, values in pending
+        ]
+
     def prepare_nodes(self):
         if self._is_sno:
+            # The single master is asked for along with the cluster definition
+            masters = self.inventory.nodes.children.groups[parts.node.Roles.master]
+            if len(masters.hosts) > 0:
+                return []
             # TODO: Check if any VMHosts ...
-            return [self._prepare_node(role=parts.node.Roles.master)]
+            return self._add_nodes([self._prepare_node(role=parts.node.Roles.master)])
 
-        nodes = []
-        while len(nodes) == 0 or self._yes_or_no_bool(
+        pending = []
+        while len(pending) == 0 or self._yes_or_no_bool(
             Question(text="Would you like to add another node [y/N]", default="no")
         ):
-            self._prepare_node()
+            pending.append(self._prepare_node())
+        return self._add_nodes(pending)
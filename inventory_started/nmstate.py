@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import string
+import typing
+from dataclasses import dataclass, field
+
+from ruamel import yaml
+
+
+class InvalidNetworkConfig(Exception):
+    @classmethod
+    def new(cls, reason):
+        return cls(f"Invalid network config: {reason}")
+
+
+def _identifiers(text: str) -> set[str]:
+    # A "$" which does not start a placeholder (e.g. "$5") is left as is
+    return {
+        name
+        for match in string.Template.pattern.finditer(text)
+        if (name := match.group("named") or match.group("braced"))
+    }
+
+
+def _whole_placeholder(text: str) -> typing.Optional[str]:
+    match = string.Template.pattern.fullmatch(text)
+    if match is not None:
+        return match.group("named") or match.group("braced")
+    return None
+
+
+def _scalar(value):
+    if isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+def _collect_identifiers(node, found: set[str]):
+    if isinstance(node, str):
+        found.update(_identifiers(node))
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            _collect_identifiers(key, found)
+            _collect_identifiers(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_identifiers(value, found)
+
+
+def _substitute(node, mapping):
+    if isinstance(node, str):
+        if "$" not in node:
+            return node
+        # Keep the type of the value when it is the whole scalar, so
+        # "id: ${vm_vlan_tag}" renders an int rather than a string
+        if (name := _whole_placeholder(node)) is not None:
+            return _scalar(mapping[name])
+        return string.Template(node).safe_substitute(
+            {k: str(v) for k, v in mapping.items()}
+        )
+    if isinstance(node, dict):
+        return {
+            _substitute(key, mapping): _substitute(value, mapping)
+            for key, value in node.items()
+        }
+    if isinstance(node, list):
+        return [_substitute(value, mapping) for value in node]
+    return node
+
+
+@dataclass(frozen=True)
+class NetworkConfigTemplate:
+    """A parsed and validated nmstate template.
+
+    Templates use ``$name`` / ``${name}`` placeholders (e.g. ``${vm_bridge_ip}``)
+    which are substituted per host by :meth:`render`; ``$$`` is a literal
+    ``$``. A scalar which is a single placeholder keeps the type of its
+    value, anything else is substituted as text. If the document has a
+    top level ``network_config`` key the other keys are treated as extra
+    host values, which must be in ``host_fields`` when it is given,
+    otherwise the whole document is the network config.
+    """
+
+    digest: str
+    document: typing.Any = field(compare=False, repr=False)
+    variables: frozenset[str] = frozenset()
+
+    @classmethod
+    def parse(
+        cls, content: str, host_fields: typing.Optional[frozenset[str]] = None
+    ) -> NetworkConfigTemplate:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        document = yaml.load(content, yaml.SafeLoader)
+        cls._validate(document, host_fields)
+        found = set()
+        _collect_identifiers(document, found)
+        return cls(digest=digest, document=document, variables=frozenset(found))
+
+    @staticmethod
+    def _validate(document, host_fields=None):
+        if not isinstance(document, dict):
+            raise InvalidNetworkConfig.new("expected a mapping")
+        if "network_config" in document and host_fields is not None:
+            unknown = document.keys() - host_fields - {"network_config"}
+            if unknown:
+                raise InvalidNetworkConfig.new(
+                    f"unknown host fields {', '.join(sorted(map(str, unknown)))}"
+                )
+        network_config = document.get("network_config", document)
+        if not isinstance(network_config, dict):
+            raise InvalidNetworkConfig.new("network_config must be a mapping")
+        interfaces = network_config.get("interfaces")
+        if not isinstance(interfaces, list) or len(interfaces) == 0:
+            raise InvalidNetworkConfig.new("interfaces must be a non empty list")
+        for interface in interfaces:
+            if not isinstance(interface, dict) or "name" not in interface:
+                raise InvalidNetworkConfig.new("every interface requires a name")
+
+    def render(self, **variables) -> dict:
+        missing = self.variables - variables.keys()
+        if missing:
+            raise InvalidNetworkConfig.new(
+                f"missing values for {', '.join(sorted(missing))}"
+            )
+        rendered = _substitute(self.document, variables)
+        if "network_config" in rendered:
+            return rendered
+        return {"network_config": rendered}
+
+
+class NetworkConfigTemplates:
+    """Cache of parsed templates keyed by the hash of their content.
+
+    When ``host_cls`` is given the extra values of a template are checked
+    against its fields.
+    """
+
+    def __init__(self, host_cls=None) -> None:
+        self._templates: dict[str, NetworkConfigTemplate] = {}
+        self._host_fields = None
+        if host_cls is not None:
+            self._host_fields = frozenset(typing.get_type_hints(host_cls))
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __iter__(self):
+        return iter(self._templates.values())
+
+    def get(self, content: str) -> NetworkConfigTemplate:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if (template := self._templates.get(digest)) is None:
+            template = NetworkConfigTemplate.parse(content, self._host_fields)
+            self._templates[digest] = template
+        return template
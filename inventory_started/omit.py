@@ -1,9 +1,17 @@
-from collections.abc import MutableMapping
+from collections.abc import Mapping
+from dataclasses import fields, is_dataclass
+from functools import lru_cache
 
 
 class Omit:
     __slots__ = tuple()
-    pass
+
+    # OMIT is compared by identity so it must survive dataclasses.asdict
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 
 OMIT = Omit()
@@ -14,3 +22,46 @@ class NoOmitDict(dict):
         if obj is None:
             obj = kwargs
         super().__init__({k: v for k, v in obj.items() if v is not OMIT})
+
+
+@lru_cache(maxsize=None)
+def field_names(cls) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
+
+
+def iter_no_omit(obj):
+    """Yield the (key, value) pairs of a parts object or mapping which are not OMIT.
+
+    Nested dataclasses are wrapped in :class:`NoOmitItems` rather than converted
+    so no intermediate dicts are built before the pairs reach the dumper.
+    """
+    if isinstance(obj, Mapping):
+        items = obj.items()
+    else:
+        items = ((name, getattr(obj, name)) for name in field_names(type(obj)))
+    for key, value in items:
+        if value is OMIT:
+            continue
+        if is_dataclass(value) and not isinstance(value, type):
+            value = NoOmitItems(value)
+        yield key, value
+
+
+class NoOmitItems:
+    """Lazy mapping view over the non-OMIT fields of one or more objects.
+
+    When several objects share a key the last one wins, as with dict.update.
+    """
+
+    __slots__ = ("objs",)
+
+    def __init__(self, *objs):
+        self.objs = objs
+
+    def __iter__(self):
+        if len(self.objs) == 1:
+            return iter_no_omit(self.objs[0])
+        merged = {}
+        for obj in self.objs:
+            merged.update(iter_no_omit(obj))
+        return iter(merged.items())
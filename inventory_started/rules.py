@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import itertools
+import typing
+from collections import Counter, defaultdict
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+
+from . import parts
+from .omit import OMIT
+from .parts.base import ValidationBase
+
+if typing.TYPE_CHECKING:
+    from .inventory import Group, Inventory
+
+GROUPS = ("bastions", "services", "vm_hosts", "nodes")
+
+# A check yields a message for every problem it finds. Group and inventory
+# checks are called with the subject and the inventory, host checks with the
+# host and a RuleContext.
+Check = typing.Callable[[typing.Any, typing.Any], typing.Iterable[str]]
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    check: Check
+    fields: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class RuleContext:
+    """The parts of the inventory host rules may read.
+
+    Host rules get this rather than the inventory so chunks of hosts can be
+    sent to a process pool without pickling the whole inventory.
+    """
+
+    vm_hosts: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_inventory(cls, inventory: Inventory) -> RuleContext:
+        return cls(vm_hosts=frozenset(inventory.vm_hosts.hosts))
+
+
+@dataclass(frozen=True)
+class Violation:
+    rule: str
+    subject: str
+    message: str
+    fields: tuple[str, ...] = ()
+
+
+@dataclass
+class ValidationReport:
+    violations: list[Violation] = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return len(self.violations) == 0
+
+    def __bool__(self):
+        return self.ok
+
+    def __iter__(self):
+        return iter(self.violations)
+
+    def __len__(self):
+        return len(self.violations)
+
+    def by_subject(self) -> dict[str, list[Violation]]:
+        res = defaultdict(list)
+        for violation in self.violations:
+            res[violation.subject].append(violation)
+        return dict(res)
+
+
+def _run(rule: Rule, subject, subject_name: str, data) -> list[Violation]:
+    return [
+        Violation(rule.name, subject_name, message, rule.fields)
+        for message in rule.check(subject, data)
+    ]
+
+
+class RuleRegistry:
+    """Rules registered against ``parts`` host classes, groups or the inventory.
+
+    Host rules are looked up by the host's class (including base classes).
+    Every violation is collected into a single :class:`ValidationReport`.
+
+    Host rules can be evaluated in chunks on an executor. The checks are pure
+    Python so threads will not speed them up; use a ``ProcessPoolExecutor``,
+    which is sent each chunk with the registry and a :class:`RuleContext`.
+    Rules must then be module level functions so they can be pickled.
+    """
+
+    def __init__(self) -> None:
+        self._host_rules: dict[type, list[Rule]] = defaultdict(list)
+        self._group_rules: dict[str, list[Rule]] = defaultdict(list)
+        self._inventory_rules: list[Rule] = []
+        self._resolved: dict[type, tuple[Rule, ...]] = {}
+
+    def host_rule(self, *host_classes: type, fields=()):
+        def decorator(check: Check):
+            rule = Rule(check.__name__, check, tuple(fields))
+            for host_cls in host_classes:
+                self._host_rules[host_cls].append(rule)
+            self._resolved.clear()
+            return check
+
+        return decorator
+
+    def group_rule(self, *group_names: str, fields=()):
+        def decorator(check: Check):
+            rule = Rule(check.__name__, check, tuple(fields))
+            for name in group_names:
+                if name not in GROUPS:
+                    raise ValueError(f"Unknown group {name}")
+                self._group_rules[name].append(rule)
+            return check
+
+        return decorator
+
+    def inventory_rule(self, fields=()):
+        def decorator(check: Check):
+            self._inventory_rules.append(Rule(check.__name__, check, tuple(fields)))
+            return check
+
+        return decorator
+
+    def rules_for(self, host_cls: type) -> tuple[Rule, ...]:
+        if (rules := self._resolved.get(host_cls)) is None:
+            rules = tuple(
+                rule
+                for base in host_cls.__mro__
+                for rule in self._host_rules.get(base, ())
+            )
+            self._resolved[host_cls] = rules
+        return rules
+
+    def _check_hosts(self, hosts, context: RuleContext) -> list[Violation]:
+        violations = []
+        for host in hosts:
+            for rule in self.rules_for(type(host)):
+                violations.extend(_run(rule, host, host.name, context))
+        return violations
+
+    def validate(
+        self,
+        inventory: Inventory,
+        executor: Executor = None,
+        chunk_size: int = 1000,
+    ) -> ValidationReport:
+        report = ValidationReport()
+
+        for rule in self._inventory_rules:
+            report.violations.extend(_run(rule, inventory, "inventory", inventory))
+
+        for name in GROUPS:
+            group = getattr(inventory, name)
+            for rule in self._group_rules.get(name, ()):
+                report.violations.extend(_run(rule, group, name, inventory))
+
+        context = RuleContext.from_inventory(inventory)
+        hosts = itertools.chain.from_iterable(
+            getattr(inventory, name).iter_hosts() for name in GROUPS
+        )
+        if executor is None:
+            report.violations.extend(self._check_hosts(hosts, context))
+            return report
+
+        chunks = []
+        while chunk := list(itertools.islice(hosts, chunk_size)):
+            chunks.append(chunk)
+        for violations in executor.map(
+            self._check_hosts, chunks, itertools.repeat(context)
+        ):
+            report.violations.extend(violations)
+        return report
+
+
+default_rules = RuleRegistry()
+
+
+@default_rules.group_rule("nodes", fields=("role",))
+def master_count(group: Group, inventory: Inventory):
+    masters = sum(
+        1 for host in group.iter_hosts() if host.role == parts.node.Roles.master
+    )
+    if not (masters == 1 or masters >= 3):
+        yield f"Expected 1 or at least 3 masters, found {masters}"
+
+
+@default_rules.host_rule(ValidationBase)
+def host_validates(host, context: RuleContext):
+    # The host's own checks, as run by Group.add_host. They get the context
+    # rather than the inventory so they can run on a process pool too.
+    if not host.validate(context):
+        yield f"{type(host).__name__} {host.name} failed validation"
+
+
+@default_rules.host_rule(parts.node.VMNode, fields=("vm_host",))
+def vm_host_exists(host, context: RuleContext):
+    if host.vm_host not in context.vm_hosts:
+        yield f"Unknown vm_host {host.vm_host}"
+
+
+@default_rules.inventory_rule(fields=("mac",))
+def unique_node_macs(inventory: Inventory, _):
+    counts = Counter(
+        str(host.mac).lower()
+        for host in inventory.nodes.iter_hosts()
+        if host.mac is not OMIT
+    )
+    for mac, count in counts.items():
+        if count > 1:
+            yield f"MAC address {mac} is used by {count} nodes"
+
+
+@default_rules.inventory_rule(fields=("ansible_host",))
+def unique_node_addresses(inventory: Inventory, _):
+    counts = Counter(str(host.ansible_host) for host in inventory.nodes.iter_hosts())
+    for address, count in counts.items():
+        if count > 1:
+            yield f"Address {address} is used by {count} nodes"
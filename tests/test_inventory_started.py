@@ -1,5 +1,31 @@
-from inventory_started import __version__
-from inventory_started.main import Questionaire
+import contextlib
+import copy
+import dataclasses
+import ipaddress
+import json
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ruamel import yaml
+
+from inventory_started import __version__, discovery, parts
+from inventory_started.discovery import (
+    BMC,
+    DiscoveryCache,
+    RedfishError,
+    _parse_address,
+    discover,
+)
+from inventory_started.dns import DuplicateRecord, ZoneData
+from inventory_started.inventory import Inventory, InventoryExporter
+from inventory_started.main import ListQuestion, Question, Questionaire
+from inventory_started.nmstate import InvalidNetworkConfig, NetworkConfigTemplates
+from inventory_started.omit import OMIT, NoOmitItems, iter_no_omit
+from inventory_started.rules import RuleRegistry, default_rules
 
 
 def test_version():
@@ -8,3 +34,483 @@ def test_version():
 
 def test_questionare():
     Questionaire().run()
+
+
+def _node(index, role=parts.node.Roles.master, host_cls=parts.node.Node, **values):
+    values = {
+        "name": f"node{index}",
+        "ansible_host": ipaddress.IPv4Address("10.0.0.1") + index,
+        "role": role,
+        "bmc_address": f"10.0.1.{index}",
+        "bmc_user": "root",
+        "bmc_password": "calvin",
+        "mac": f"52:54:00:00:00:{index:02x}",
+        **values,
+    }
+    if host_cls is parts.node.Node:
+        values.setdefault("vendor", next(iter(parts.node.Vendors)))
+    return host_cls(**values)
+
+
+def _add_nodes(inventory, *nodes):
+    for node in nodes:
+        inventory.nodes.children.groups[node.role].add_host(node, validate=False)
+    return inventory
+
+
+def _cluster_definition(**values):
+    hints = typing.get_type_hints(parts.ClusterDefinition)
+    values = {
+        "cluster_name": "lab",
+        "base_dns_domain": "example.com",
+        "openshift_full_version": next(iter(hints["openshift_full_version"])),
+        "api_vip": ipaddress.IPv4Address("10.0.0.100"),
+        "ingress_vip": ipaddress.IPv4Address("10.0.0.101"),
+        "machine_network_cidr": ipaddress.IPv4Network("10.0.0.0/16"),
+        "service_network_cidr": ipaddress.IPv4Network("172.30.0.0/16"),
+        "cluster_network_cidr": ipaddress.IPv4Network("10.128.0.0/14"),
+        "cluster_network_host_prefix": 23,
+        "network_type": next(iter(hints["network_type"])),
+        "ntp_server": ipaddress.IPv4Address("10.0.0.254"),
+        **values,
+    }
+    return parts.ClusterDefinition(**values)
+
+
+def _crucible_config(**values):
+    return parts.CrucibleConfig(
+        **{
+            "repo_root_path": "/opt/crucible",
+            "setup_ntp_service": True,
+            "setup_http_store_service": True,
+            "setup_dns_service": True,
+            "setup_registry_service": True,
+            "setup_assisted_installer": True,
+            **values,
+        }
+    )
+
+
+def _export(inventory, **kwargs):
+    return yaml.load(InventoryExporter(inventory, **kwargs).export(), yaml.SafeLoader)
+
+
+def _rules_failed(report):
+    return sorted({violation.rule for violation in report})
+
+
+def test_network_config_template_is_parsed_once():
+    content = (
+        "interfaces:\n"
+        "  - name: br0\n"
+        "    description: costs $5\n"
+        "    ipv4:\n"
+        "      address:\n"
+        "        - ip: ${vm_bridge_ip}\n"
+        "          prefix-length: 24\n"
+        "  - name: ${vm_bridge_interface}.${vm_vlan_tag}\n"
+        "    vlan:\n"
+        "      id: ${vm_vlan_tag}\n"
+    )
+    templates = NetworkConfigTemplates()
+    template = templates.get(content)
+    assert templates.get(content) is template
+    assert template.variables == {"vm_bridge_ip", "vm_bridge_interface", "vm_vlan_tag"}
+
+    rendered = template.render(
+        vm_bridge_ip=ipaddress.IPv4Address("10.0.0.2"),
+        vm_bridge_interface="eno1",
+        vm_vlan_tag=10,
+    )
+    interfaces = rendered["network_config"]["interfaces"]
+    assert interfaces[0]["description"] == "costs $5"
+    assert interfaces[0]["ipv4"]["address"][0]["ip"] == "10.0.0.2"
+    assert interfaces[1]["name"] == "eno1.10"
+    assert interfaces[1]["vlan"]["id"] == 10
+
+
+def test_network_config_template_extra_values_are_host_fields():
+    templates = NetworkConfigTemplates(parts.VMHost)
+    network_config = "network_config:\n  interfaces:\n    - name: eno1\n"
+    template = templates.get(network_config + "dns: ${dns}\n")
+    assert template.render(dns="10.0.0.3")["dns"] == "10.0.0.3"
+    with pytest.raises(InvalidNetworkConfig, match="vm_bridge_mtu"):
+        templates.get(network_config + "vm_bridge_mtu: 9000\n")
+
+
+def test_rule_registry_reports_every_violation():
+    registry = RuleRegistry()
+
+    @registry.host_rule(parts.node.Node, fields=("bmc_user",))
+    def not_root(host, context):
+        if host.bmc_user == "root":
+            yield "Do not use root"
+
+    inventory = _add_nodes(Inventory(), _node(0), _node(1, bmc_user="admin"), _node(2))
+    report = registry.validate(inventory)
+    assert not report
+    assert sorted(report.by_subject()) == ["node0", "node2"]
+    assert all(v.fields == ("bmc_user",) for v in report)
+
+
+def test_default_rules_master_count():
+    assert Inventory().report().by_subject()["nodes"][0].rule == "master_count"
+
+    for masters, ok in ((1, True), (2, False), (3, True)):
+        inventory = _add_nodes(Inventory(), *(_node(i) for i in range(masters)))
+        assert inventory.report().ok is ok
+        assert inventory.validate() is ok
+
+
+class _InvalidNode(parts.node.Node):
+    def validate(self, inventory):
+        return False
+
+
+def test_default_rules_include_host_validate():
+    inventory = _add_nodes(Inventory(), _node(0, host_cls=_InvalidNode))
+    report = inventory.report()
+    assert _rules_failed(report) == ["host_validates"]
+    assert list(report.by_subject()) == ["node0"]
+    assert inventory.validate() is False
+
+
+def test_default_rules_vm_host_exists():
+    inventory = _add_nodes(
+        Inventory(),
+        _node(0, host_cls=parts.node.VMNode, vm_host="vm_host0"),
+        _node(1, host_cls=parts.node.VMNode, vm_host="missing"),
+        _node(2, host_cls=parts.node.VMNode, vm_host="vm_host0"),
+    )
+    inventory.vm_hosts.add_host(
+        parts.VMHost(
+            name="vm_host0",
+            ansible_host=ipaddress.IPv4Address("10.0.2.1"),
+            vm_bridge_ip=ipaddress.IPv4Address("10.0.2.2"),
+            vm_bridge_interface="eno1",
+            dns=ipaddress.IPv4Address("10.0.2.3"),
+        ),
+        validate=False,
+    )
+    report = inventory.report()
+    assert _rules_failed(report) == ["vm_host_exists"]
+    assert list(report.by_subject()) == ["node1"]
+
+
+def test_default_rules_unique_macs_and_addresses():
+    inventory = _add_nodes(
+        Inventory(),
+        _node(0),
+        _node(1, mac="52:54:00:00:00:00"),
+        _node(2, ansible_host=ipaddress.IPv4Address("10.0.0.1")),
+    )
+    report = inventory.report()
+    assert _rules_failed(report) == ["unique_node_addresses", "unique_node_macs"]
+
+
+def test_default_rules_on_process_pool():
+    nodes = [_node(i, host_cls=parts.node.VMNode, vm_host="missing") for i in range(3)]
+    inventory = _add_nodes(Inventory(), *nodes)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parallel = default_rules.validate(inventory, executor=executor, chunk_size=1)
+    assert parallel.violations == inventory.report().violations
+    assert len(parallel) == 3
+
+
+def test_iter_no_omit_skips_omitted_fields():
+    node = _node(0, host_cls=parts.node.VMNode, vm_spec=parts.node.VMSpec())
+    items = dict(iter_no_omit(dataclasses.replace(node, mac=OMIT)))
+    assert "mac" not in items
+    assert items["name"] == "node0"
+    assert isinstance(items["vm_spec"], NoOmitItems)
+    assert copy.deepcopy(OMIT) is OMIT
+
+
+def test_export_has_no_aliases_for_shared_values():
+    address = ipaddress.IPv4Address("10.0.0.5")
+    inventory = _add_nodes(Inventory(), _node(0, ansible_host=address))
+    inventory.all_section.add_part(
+        "cluster_definition", _cluster_definition(api_vip=address, ingress_vip=address)
+    )
+    exported = InventoryExporter(inventory).export()
+    assert "&" not in exported and "*id" not in exported
+    loaded = yaml.load(exported, yaml.SafeLoader)
+    assert loaded["all"]["vars"]["api_vip"] == "10.0.0.5"
+    masters = loaded["all"]["children"]["nodes"]["children"]["masters"]["hosts"]
+    assert masters["node0"]["ansible_host"] == "10.0.0.5"
+
+
+def test_export_all_vars_last_part_wins():
+    inventory = Inventory()
+    inventory.all_section.add_part("first", _crucible_config(repo_root_path="/a"))
+    inventory.all_section.add_part("second", _crucible_config(repo_root_path="/b"))
+    assert _export(inventory)["all"]["vars"]["repo_root_path"] == "/b"
+
+
+def test_inventory_overlay_is_copy_on_write():
+    base = _add_nodes(Inventory(), _node(0))
+    base.all_section.add_part("crucible_config", _crucible_config())
+    base.all_section.add_part("cluster_definition", _cluster_definition())
+    base.services.add_host(
+        parts.services.NTPHost(
+            name="ntp_host",
+            ansible_host=ipaddress.IPv4Address("10.0.0.254"),
+            ntp_server_allow=ipaddress.IPv4Network("10.0.0.0/16"),
+        ),
+        validate=False,
+    )
+
+    overlays = [base.overlay() for _ in range(1000)]
+    overlays[0].all_section.update_part("cluster_definition", cluster_name="site0")
+    overlays[0].nodes.update_host("node0", bmc_user="site0")
+
+    base_parts = base.all_section.parts
+    assert base_parts["cluster_definition"].cluster_name == "lab"
+    assert all(
+        overlay.all_section.parts["crucible_config"] is base_parts["crucible_config"]
+        for overlay in overlays
+    )
+    assert overlays[1].services.hosts["ntp_host"] is base.services.hosts["ntp_host"]
+    assert overlays[0].all_section.parts["cluster_definition"].cluster_name == "site0"
+    assert [n.bmc_user for n in base.nodes.iter_hosts()] == ["root"]
+    assert [n.bmc_user for n in overlays[0].nodes.iter_hosts()] == ["site0"]
+    assert [n.bmc_user for n in overlays[1].nodes.iter_hosts()] == ["root"]
+
+    loaded = _export(overlays[0], overlay_only=True)
+    assert loaded["all"]["vars"]["cluster_name"] == "site0"
+    assert "repo_root_path" not in loaded["all"]["vars"]
+    assert not loaded["all"]["children"]["services"]["hosts"]
+    masters = loaded["all"]["children"]["nodes"]["children"]["masters"]["hosts"]
+    assert masters["node0"]["bmc_user"] == "site0"
+
+
+_REDFISH_RESOURCES = {
+    "/redfish/v1/Systems": {"Members": [{"@odata.id": "/redfish/v1/Systems/1"}]},
+    "/redfish/v1/Systems/1": {
+        "Manufacturer": "Dell Inc.",
+        "Model": "PowerEdge R640",
+        "SerialNumber": "ABC123",
+        "MemorySummary": {"TotalSystemMemoryGiB": 192},
+        "ProcessorSummary": {"Count": 2},
+        "EthernetInterfaces": {"@odata.id": "/redfish/v1/Systems/1/Eth"},
+    },
+    "/redfish/v1/Systems/1/Eth": {
+        "Members": [
+            {"@odata.id": "/redfish/v1/Systems/1/Eth/1"},
+            {"@odata.id": "/redfish/v1/Systems/1/Eth/2"},
+        ]
+    },
+    "/redfish/v1/Systems/1/Eth/1": {
+        "MACAddress": "52:54:00:00:00:01",
+        "LinkStatus": "LinkDown",
+    },
+    "/redfish/v1/Systems/1/Eth/2": {
+        "MACAddress": "52:54:00:AA:00:02",
+        "LinkStatus": "LinkUp",
+    },
+}
+
+
+class _RedfishHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        path = self.path.split("?", 1)[0]
+        body = json.dumps(_REDFISH_RESOURCES.get(path, {})).encode()
+        self.send_response(200 if path in _REDFISH_RESOURCES else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _redfish_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RedfishHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _bmcs(server, count):
+    port = server.server_address[1]
+    return [
+        BMC(f"redfish+http://127.0.0.1:{port}/?node={i}", "root", "pw")
+        for i in range(count)
+    ]
+
+
+def test_redfish_discovery_against_mock_server(tmp_path):
+    with _redfish_server() as server:
+        bmcs = _bmcs(server, 50)
+        cache = DiscoveryCache(tmp_path / "redfish.json")
+
+        results = discover(bmcs, cache=cache)
+        facts = results[bmcs[0].address]
+        assert facts.vendor is parts.node.Vendors.Dell
+        assert facts.boot_mac == "52:54:00:aa:00:02"
+        assert facts.cpu_count == 2
+
+        seen = len(server.requests)
+        again = discover(bmcs, cache=DiscoveryCache(tmp_path / "redfish.json"))
+        assert again == results
+        assert len(server.requests) == seen
+
+        discover(bmcs[:1], cache=cache, refresh=True)
+        assert len(server.requests) > seen
+
+
+def test_redfish_discovery_cache_ignores_unreadable_file(tmp_path):
+    path = tmp_path / "redfish.json"
+    cache = DiscoveryCache(path)
+    path.write_text("{not json")
+    assert cache.get("bmc0") is None
+
+    path.write_text(json.dumps({"bmc0": {"renamed_field": 1}}))
+    assert DiscoveryCache(path).get("bmc0") is None
+
+    with _redfish_server() as server:
+        bmc = _bmcs(server, 1)[0]
+        cache = DiscoveryCache(path)
+        discover([bmc], cache=cache)
+        assert DiscoveryCache(path).get(bmc.address).model == "PowerEdge R640"
+        cache.invalidate(bmc.address)
+        assert DiscoveryCache(path).get(bmc.address) is None
+
+
+def test_questionaire_discovers_all_nodes_at_once(monkeypatch, tmp_path):
+    questionaire = Questionaire()
+    questionaire.discovery_cache = DiscoveryCache(tmp_path / "redfish.json")
+    monkeypatch.setattr(questionaire, "_output", lambda *args, **kwargs: None)
+    answers = iter(["y", "n"])
+    monkeypatch.setattr(questionaire, "_input", lambda text: next(answers))
+    calls = []
+
+    def discover_once(bmcs, **kwargs):
+        calls.append(kwargs)
+        return discover(bmcs, **kwargs)
+
+    monkeypatch.setattr(discovery, "discover", discover_once)
+    with _redfish_server() as server:
+        pending = [
+            (
+                parts.node.Node,
+                {
+                    "name": f"node{i}",
+                    "ansible_host": ipaddress.IPv4Address("10.0.0.1") + i,
+                    "role": parts.node.Roles.master,
+                    "bmc_address": bmc.address,
+                    "bmc_user": bmc.user,
+                    "bmc_password": bmc.password,
+                },
+            )
+            for i, bmc in enumerate(_bmcs(server, 3))
+        ]
+        nodes = questionaire._add_nodes(pending)
+
+    assert len(calls) == 1 and calls[0]["verify"] is False
+    assert [node["mac"] for node in nodes] == ["52:54:00:aa:00:02"] * 3
+    assert all(node["vendor"] is parts.node.Vendors.Dell for node in nodes)
+    assert len(list(questionaire.inventory.nodes.iter_hosts())) == 3
+
+
+def test_redfish_address_schemes():
+    assert _parse_address("redfish-virtualmedia://bmc/redfish/v1/Systems/1") == (
+        "https",
+        "bmc",
+        None,
+        "/redfish/v1/Systems/1",
+    )
+    assert _parse_address("idrac-virtualmedia+http://bmc:8000")[:3] == (
+        "http",
+        "bmc",
+        8000,
+    )
+    assert _parse_address("ilo5-redfish://bmc")[0] == "https"
+    assert _parse_address("10.0.0.1")[:2] == ("https", "10.0.0.1")
+    for address in ("ipmi://bmc", "redfish+ftp://bmc"):
+        with pytest.raises(RedfishError):
+            _parse_address(address)
+
+
+def test_matches_type_union_and_list_questions(monkeypatch):
+    questionaire = Questionaire()
+    outputs = []
+    monkeypatch.setattr(questionaire, "_output", outputs.append)
+
+    answers = iter(["not-an-ip", "10.0.0.1"])
+    monkeypatch.setattr(questionaire, "_input", lambda text: next(answers))
+    answer = questionaire._matches_type(
+        Question(text="ip", field="ip"),
+        typing.Union[ipaddress.IPv4Address, int],
+    )
+    assert answer == ipaddress.IPv4Address("10.0.0.1")
+    assert len(outputs) == 1
+
+    answers = iter(["10.0.0.1,,", "10.0.0.1, 10.0.0.2"])
+    monkeypatch.setattr(questionaire, "_input", lambda text: next(answers))
+    answer = questionaire._matches_type(
+        ListQuestion(text="dns", field="dns_servers"),
+        list[ipaddress.IPv4Address],
+    )
+    assert answer == [
+        ipaddress.IPv4Address("10.0.0.1"),
+        ipaddress.IPv4Address("10.0.0.2"),
+    ]
+
+
+def test_zone_data_from_inventory():
+    inventory = _add_nodes(
+        Inventory(),
+        _node(0, mac="52:54:00:AA:BB:01"),
+        _node(1, role=parts.node.Roles.worker, mac=OMIT),
+    )
+    inventory.all_section.add_part("cluster_definition", _cluster_definition())
+
+    zone = ZoneData.from_inventory(inventory)
+    records = {(r.name, r.type): r.value for r in zone.records}
+    assert records[("api.lab.example.com", "A")] == "10.0.0.100"
+    assert records[("api-int.lab.example.com", "A")] == "10.0.0.100"
+    assert records[("*.apps.lab.example.com", "A")] == "10.0.0.101"
+    assert records[("1.0.0.10.in-addr.arpa", "PTR")] == "node0.lab.example.com."
+    assert zone.by_mac["52:54:00:aa:bb:01"].ip == "10.0.0.1"
+    assert zone.by_ip["10.0.0.2"].name == "node1.lab.example.com"
+    assert len(zone.leases) == 1
+    assert "dhcp_static_leases" in zone.export()
+
+
+def test_zone_data_sno_and_duplicate_addresses():
+    address = ipaddress.IPv4Address("10.0.0.1")
+    sno = _add_nodes(Inventory(), _node(0))
+    sno.all_section.add_part(
+        "cluster_definition", _cluster_definition(api_vip=address, ingress_vip=address)
+    )
+    zone = ZoneData.from_inventory(sno)
+    ptrs = [r.value for r in zone.records if r.type == "PTR"]
+    assert ptrs == ["api.lab.example.com."]
+
+    duplicate = _add_nodes(
+        Inventory(), _node(0), _node(1, ansible_host=address, mac=OMIT)
+    )
+    duplicate.all_section.add_part("cluster_definition", _cluster_definition())
+    with pytest.raises(DuplicateRecord):
+        ZoneData.from_inventory(duplicate)
+
+    # Only a single master may share the api VIP
+    on_api_vip = _add_nodes(
+        Inventory(),
+        _node(0),
+        _node(1),
+        _node(2, ansible_host=ipaddress.IPv4Address("10.0.0.100")),
+    )
+    on_api_vip.all_section.add_part("cluster_definition", _cluster_definition())
+    with pytest.raises(DuplicateRecord):
+        ZoneData.from_inventory(on_api_vip)